@@ -0,0 +1 @@
+"""Cœur de BuildozAir, utilisable sans Streamlit (application web, CLI, tâches planifiées)."""
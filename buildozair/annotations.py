@@ -0,0 +1,261 @@
+"""Modèle des annotations : référentiels, tableaux pandas et import / export en masse."""
+import io
+import json
+import math
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Référentiels des annotations
+CATEGORIES = ["QHSE", "Qualité", "Planning", "Autre"]
+INTERVENANTS = ["Architecte", "Électricien", "Client", "Assistante"]
+STATUSES = ["À faire", "En cours", "Résolu"]
+ANNOTATION_TYPES = ["point", "rectangle"]
+
+ANNOTATION_FIELDS = ["id", "timestamp", "type", "x", "y", "width", "height", "category", "intervenant", "comment",
+                     "photo", "status", "due_date"]
+EXPORT_COLUMNS = ["project_name", "image_name"] + ANNOTATION_FIELDS
+COORD_FIELDS = ["x", "y", "width", "height"]
+EXPORT_FORMATS = {"CSV": "csv", "Parquet": "parquet", "GeoJSON": "geojson"}
+EXPORT_CHUNK_SIZE = 5000
+
+PARQUET_SCHEMA = pa.schema(
+    [(col, pa.float64() if col in COORD_FIELDS else pa.string()) for col in EXPORT_COLUMNS])
+
+
+def iter_annotation_chunks(projects, project_name=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Parcourt les annotations par blocs de `chunk_size` lignes (DataFrame aux colonnes EXPORT_COLUMNS)."""
+    rows = []
+    for project in projects:
+        if project_name is not None and project.get("project_name") != project_name:
+            continue
+        for image in project.get("images", []):
+            for ann in image.get("annotations", []):
+                row = {"project_name": project["project_name"], "image_name": image["image_name"]}
+                row.update({field: ann.get(field) for field in ANNOTATION_FIELDS})
+                rows.append(row)
+                if len(rows) >= chunk_size:
+                    yield _normalize_chunk(pd.DataFrame(rows, columns=EXPORT_COLUMNS))
+                    rows = []
+    if rows:
+        yield _normalize_chunk(pd.DataFrame(rows, columns=EXPORT_COLUMNS))
+
+
+def _normalize_chunk(df):
+    for col in COORD_FIELDS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    for col in EXPORT_COLUMNS:
+        if col not in COORD_FIELDS:
+            df[col] = df[col].where(df[col].notna(), None).astype("object")
+    return df
+
+
+def _chunk_to_features(df):
+    for rec in df.to_dict("records"):
+        # NaN n'existe pas en JSON : coordonnées manquantes -> null, et géométrie nulle si incomplète
+        rec = {k: None if isinstance(v, float) and math.isnan(v) else v for k, v in rec.items()}
+        x, y, w, h = rec["x"], rec["y"], rec["width"], rec["height"]
+        if x is None or y is None:
+            geometry = None
+        elif rec["type"] == "point":
+            geometry = {"type": "Point", "coordinates": [x, y]}
+        elif w is None or h is None:
+            geometry = None
+        else:
+            geometry = {"type": "Polygon",
+                        "coordinates": [[[x, y], [x + w, y], [x + w, y + h], [x, y + h], [x, y]]]}
+        yield {"type": "Feature", "geometry": geometry, "properties": rec}
+
+
+def export_annotations(projects, fmt, target, project_name=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Écrit les annotations dans `target` (fichier binaire) bloc par bloc ; renvoie le nombre de lignes.
+
+    Les coordonnées restent normalisées (0-1) par rapport au plan, y compris pour le GeoJSON.
+    """
+    count = 0
+    chunks = iter_annotation_chunks(projects, project_name, chunk_size)
+    if fmt == "parquet":
+        with pq.ParquetWriter(target, PARQUET_SCHEMA) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=PARQUET_SCHEMA, preserve_index=False))
+                count += len(chunk)
+    elif fmt == "csv":
+        for i, chunk in enumerate(chunks):
+            target.write(chunk.to_csv(index=False, header=(i == 0)).encode("utf-8"))
+            count += len(chunk)
+        if count == 0:
+            target.write((",".join(EXPORT_COLUMNS) + "\n").encode("utf-8"))
+    elif fmt == "geojson":
+        target.write(b'{"type": "FeatureCollection", "features": [')
+        for chunk in chunks:
+            for feature in _chunk_to_features(chunk):
+                target.write((b"," if count else b"") + json.dumps(feature, allow_nan=False).encode("utf-8"))
+                count += 1
+        target.write(b"]}")
+    else:
+        raise ValueError(f"Format d'export inconnu : {fmt}")
+    return count
+
+
+def read_annotations_file(file_bytes, name):
+    """Lit un fichier CSV / Parquet / GeoJSON d'annotations et renvoie un DataFrame brut."""
+    lower = name.lower()
+    if lower.endswith(".parquet"):
+        return pd.read_parquet(io.BytesIO(file_bytes))
+    if lower.endswith((".geojson", ".json")):
+        collection = json.loads(file_bytes.decode("utf-8"))
+        features = collection.get("features", []) if isinstance(collection, dict) else []
+        df = pd.DataFrame([f.get("properties") or {} for f in features])
+        # Les propriétés x/y/width/height priment ; à défaut on les déduit de la géométrie
+        bounds = pd.DataFrame([_geometry_bounds(f.get("geometry")) for f in features],
+                              columns=COORD_FIELDS + ["geom_type"])
+        for col in COORD_FIELDS:
+            df[col] = df[col].fillna(bounds[col]) if col in df.columns else bounds[col]
+        if "type" not in df.columns:
+            df["type"] = bounds["geom_type"]
+        return df
+    return pd.read_csv(io.BytesIO(file_bytes), dtype=str, keep_default_na=False)
+
+
+def _geometry_bounds(geometry):
+    if not geometry or not geometry.get("coordinates"):
+        return [None, None, None, None, None]
+    if geometry.get("type") == "Point":
+        x, y = geometry["coordinates"][:2]
+        return [x, y, 0.0, 0.0, "point"]
+    ring = geometry["coordinates"][0]
+    xs = [pt[0] for pt in ring]
+    ys = [pt[1] for pt in ring]
+    return [min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys), "rectangle"]
+
+
+def validate_annotations_df(df, known_images, existing_projects=()):
+    """Valide un lot d'annotations de façon vectorisée.
+
+    `known_images` est la liste des couples (projet, plan) existants (voir catalog.known_images).
+    `existing_projects` sont les projets visés par le lot : une ligne dont l'identifiant, ou le
+    triplet (projet, plan, horodatage), existe déjà est rejetée, ce qui rend un ré-import sans effet.
+    Chaque ligne retenue reçoit un identifiant unique si elle n'en a pas.
+
+    Renvoie (valides, erreurs) : `valides` a les colonnes EXPORT_COLUMNS normalisées,
+    `erreurs` liste la ligne source (numérotée à partir de 1) et le motif du rejet.
+    """
+    df = df.reset_index(drop=True).copy()
+    n = len(df)
+    for col in EXPORT_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    text_cols = ["project_name", "image_name", "id", "timestamp", "type", "category", "intervenant", "comment",
+                 "photo", "status", "due_date"]
+    for col in text_cols:
+        df[col] = df[col].where(df[col].notna(), "").astype(str).str.strip()
+    for col in COORD_FIELDS:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    # Identités déjà présentes (avant de compléter les horodatages manquants)
+    existing_ids = set()
+    existing_stamps = set()
+    for project in existing_projects:
+        for img in project.get("images", []):
+            for ann in img.get("annotations", []):
+                if ann.get("id"):
+                    existing_ids.add(ann["id"])
+                existing_stamps.add((project["project_name"], img["image_name"], ann.get("timestamp")))
+    triples = pd.MultiIndex.from_arrays([df["project_name"], df["image_name"], df["timestamp"]])
+    stamp_exists = (df["timestamp"] != "") & triples.isin(list(existing_stamps))
+
+    # Valeurs par défaut
+    df.loc[df["width"].isna() & df["height"].isna(), ["width", "height"]] = 0.0
+    has_extent = (df["width"].fillna(0) > 0) | (df["height"].fillna(0) > 0)
+    df["type"] = df["type"].mask(df["type"] == "", np.where(has_extent, "rectangle", "point"))
+    df.loc[df["category"] == "", "category"] = "Autre"
+    df.loc[df["status"] == "", "status"] = "À faire"
+    df.loc[df["timestamp"] == "", "timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    df.loc[df["type"] == "point", ["width", "height"]] = 0.0
+
+    due = pd.to_datetime(df["due_date"], format="%Y-%m-%d", errors="coerce")
+    stamp = pd.to_datetime(df["timestamp"], format="%Y-%m-%d %H:%M:%S", errors="coerce")
+    known_images = pd.MultiIndex.from_tuples(list(known_images), names=["project_name", "image_name"])
+    pairs = pd.MultiIndex.from_arrays([df["project_name"], df["image_name"]])
+    coords_ok = df[COORD_FIELDS].notna().all(axis=1)
+
+    checks = [
+        ((df["project_name"] == "") | (df["image_name"] == ""), "projet ou image manquant"),
+        ((df["project_name"] != "") & (df["image_name"] != "") & ~pairs.isin(known_images),
+         "couple projet / image inconnu"),
+        (~df["type"].isin(ANNOTATION_TYPES), "type invalide"),
+        (~df["category"].isin(CATEGORIES), "catégorie invalide"),
+        (~df["status"].isin(STATUSES), "statut invalide"),
+        ((df["due_date"] != "") & due.isna(), "échéance invalide (AAAA-MM-JJ attendu)"),
+        (stamp.isna(), "horodatage invalide (AAAA-MM-JJ HH:MM:SS attendu)"),
+        ((df["id"] != "") & df["id"].duplicated(), "identifiant en double dans le fichier"),
+        (df["id"].isin(existing_ids) | stamp_exists, "annotation déjà présente"),
+        (~coords_ok, "coordonnées manquantes"),
+        (coords_ok & ((df["x"] < 0) | (df["y"] < 0) | (df["width"] < 0) | (df["height"] < 0)
+                      | (df["x"] + df["width"] > 1) | (df["y"] + df["height"] > 1)),
+         "coordonnées hors du plan (0-1)"),
+    ]
+    errors = pd.concat(
+        [pd.DataFrame({"ligne": np.flatnonzero(mask.to_numpy()) + 1, "erreur": reason}) for mask, reason in checks],
+        ignore_index=True).sort_values("ligne", kind="stable").reset_index(drop=True)
+    invalid = np.zeros(n, dtype=bool)
+    invalid[errors["ligne"].to_numpy() - 1] = True
+
+    valid = df.loc[~invalid, EXPORT_COLUMNS].copy()
+    valid[COORD_FIELDS] = valid[COORD_FIELDS].round(4)
+    valid["photo"] = valid["photo"].where(valid["photo"] != "", None)
+    valid["due_date"] = due[~invalid].dt.strftime("%Y-%m-%d").fillna("")
+    missing_id = valid["id"] == ""
+    valid.loc[missing_id, "id"] = [uuid.uuid4().hex for _ in range(int(missing_id.sum()))]
+    return valid, errors
+
+
+def import_annotations(projects, valid_df):
+    """Ajoute en mémoire les annotations validées, groupées par plan, sans écrire sur S3."""
+    if valid_df.empty:
+        return 0
+    images = {(p["project_name"], img["image_name"]): img
+              for p in projects if "project_name" in p for img in p.get("images", [])}
+    for (project_name, image_name), group in valid_df.groupby(["project_name", "image_name"], sort=False):
+        images[(project_name, image_name)]["annotations"].extend(group[ANNOTATION_FIELDS].to_dict("records"))
+    return len(valid_df)
+
+
+def make_annotation(ann_type, x, y, width=0.0, height=0.0, **fields):
+    """Nouvelle annotation aux coordonnées normalisées (0-1), avec les valeurs par défaut de l'application."""
+    ann = {
+        "id": uuid.uuid4().hex,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "type": ann_type,
+        "x": round(x, 4),
+        "y": round(y, 4),
+        "width": round(width, 4),
+        "height": round(height, 4),
+        "category": "Autre",
+        "intervenant": "",
+        "comment": "",
+        "photo": None,
+        "status": "À faire",
+        "due_date": ""
+    }
+    ann.update(fields)
+    return ann
+
+
+def find_project(projects, project_name):
+    return next((p for p in projects if p.get("project_name") == project_name), None)
+
+
+def annotations_frame(project):
+    """Toutes les annotations d'un projet dans un DataFrame, échéances converties en dates (NaT si absentes)."""
+    frames = [pd.DataFrame(img["annotations"]) for img in project.get("images", []) if img.get("annotations")]
+    if not frames:
+        return pd.DataFrame(columns=ANNOTATION_FIELDS)
+    df = pd.concat(frames, ignore_index=True)
+    if "due_date" in df.columns:
+        df["due_date"] = pd.to_datetime(df["due_date"], errors='coerce')
+    return df
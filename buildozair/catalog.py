@@ -0,0 +1,170 @@
+"""Catalogue compact des projets et stockage d'un objet S3 compressé par projet.
+
+Le catalogue (``catalog.json.gz``) ne contient que le nom, la clé, les noms de plans,
+les compteurs, les agrégats de planning et la date de modification de chaque projet. Le détail d'un projet
+(plans et annotations) n'est téléchargé qu'à la demande depuis ``projects/<clé>.json.gz``.
+"""
+import gzip
+import hashlib
+import json
+import re
+from datetime import datetime
+
+from . import storage
+from .planning import project_stats
+
+CATALOG_VERSION = 1
+
+
+def encode(obj):
+    return gzip.compress(json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+
+def decode(data):
+    return json.loads(gzip.decompress(data).decode("utf-8"))
+
+
+def project_slug(project_name):
+    """Nom de fichier sûr et unique : le condensé distingue les noms qui donnent le même texte ("A/B", "A_B")."""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", project_name).strip("_")[:40]
+    digest = hashlib.sha1(project_name.encode("utf-8")).hexdigest()[:8]
+    return f"{slug}-{digest}"
+
+
+def project_key(project_name):
+    return f"{storage.S3_PROJECTS_PREFIX}{project_slug(project_name)}.json.gz"
+
+
+def make_entry(project, data, stats=None):
+    """Entrée de catalogue d'un projet ; `data` est le projet encodé (son empreinte sert d'etag).
+
+    `stats` sont les agrégats de planning déjà mis à jour par l'appelant ; à défaut ils sont recalculés.
+    """
+    images = project.get("images", [])
+    return {
+        "project_name": project["project_name"],
+        "key": project_key(project["project_name"]),
+        "etag": hashlib.sha1(data).hexdigest()[:16],
+        "images": [img["image_name"] for img in images],
+        "plan_count": len(images),
+        "annotation_count": sum(len(img.get("annotations", [])) for img in images),
+        "stats": stats if stats is not None else project_stats(project),
+        "last_modified": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def find_entry(catalog, project_name):
+    return next((e for e in catalog if e["project_name"] == project_name), None)
+
+
+def entry_stats(entry):
+    """Agrégats d'une entrée (recalculés si l'entrée n'en a pas, voir ensure_stats)."""
+    if "stats" not in entry:
+        entry["stats"] = project_stats(load_project(entry))
+    return entry["stats"]
+
+
+def ensure_stats(catalog):
+    """Calcule les agrégats des entrées qui n'en ont pas encore et les enregistre dans le catalogue.
+
+    Les entrées écrites avant l'introduction des agrégats ne sont ainsi chargées qu'une seule
+    fois, par la première session ; les suivantes lisent les compteurs dans le catalogue.
+    """
+    missing = [e for e in catalog if "stats" not in e]
+    if not missing:
+        return catalog
+    computed = {(e["key"], e["etag"]): project_stats(load_project(e)) for e in missing}
+    # Relecture pour ne pas écraser les écritures concurrentes ; seules les versions calculées sont complétées
+    fresh = read_catalog() or catalog
+    for e in fresh:
+        if "stats" not in e and (e["key"], e["etag"]) in computed:
+            e["stats"] = computed[(e["key"], e["etag"])]
+    save_catalog(fresh)
+    return fresh
+
+
+def known_images(catalog):
+    """Couples (projet, plan) existants, pour valider un import sans charger les projets."""
+    return [(e["project_name"], image_name) for e in catalog for image_name in e["images"]]
+
+
+def read_catalog():
+    """Catalogue en lecture seule, ou None s'il n'existe pas encore (aucune écriture sur S3)."""
+    data = storage.read_object(storage.S3_CATALOG_KEY)
+    if data is None:
+        return None
+    return decode(data)["projects"]
+
+
+def load_catalog():
+    """Catalogue, créé depuis l'ancien annotations.json s'il n'existe pas encore (écrit sur S3)."""
+    catalog = read_catalog()
+    if catalog is None:
+        return migrate_legacy_annotations()
+    return catalog
+
+
+def save_catalog(catalog):
+    storage.write_object(storage.S3_CATALOG_KEY, encode({"version": CATALOG_VERSION, "projects": catalog}))
+
+
+def migrate_legacy_annotations():
+    """Découpe l'ancien annotations.json en un objet par projet et crée le catalogue."""
+    projects = [p for p in storage.load_projects() if "project_name" in p]
+    if not projects:
+        return []
+    storage.migrate_legacy_images(projects)
+    return save_projects(projects, catalog=[])
+
+
+def load_project(entry):
+    return decode(storage.download_file(entry["key"]))
+
+
+def iter_projects(catalog):
+    """Charge les projets un par un : un seul projet décodé en mémoire à la fois."""
+    for entry in catalog:
+        yield load_project(entry)
+
+
+def save_projects(projects, catalog=None, stats=None):
+    """Écrit un objet par projet modifié puis le catalogue une seule fois ; renvoie le catalogue à jour.
+
+    Sans `catalog`, le catalogue est relu juste avant l'écriture pour ne pas effacer
+    les projets créés entre-temps par une autre session. `stats` associe à un nom de projet
+    ses agrégats mis à jour de façon incrémentale (voir planning.apply_annotation).
+    """
+    stats = stats or {}
+    if catalog is None:
+        catalog = load_catalog()
+    entries = {e["project_name"]: e for e in catalog}
+    for project in projects:
+        data = encode(project)
+        entry = make_entry(project, data, stats.get(project["project_name"]))
+        storage.write_object(entry["key"], data)
+        entries[project["project_name"]] = entry
+    catalog = list(entries.values())
+    save_catalog(catalog)
+    return catalog
+
+
+def create_project(project):
+    """Enregistre un nouveau projet ; lève ValueError si le nom existe déjà (jamais d'écrasement)."""
+    catalog = load_catalog()
+    if find_entry(catalog, project["project_name"]) is not None:
+        raise ValueError(f"Le projet {project['project_name']} existe déjà.")
+    return save_projects([project], catalog=catalog)
+
+
+def save_project(project, stats=None):
+    return save_projects([project], stats={project["project_name"]: stats} if stats is not None else None)
+
+
+def delete_project(project_name):
+    catalog = load_catalog()
+    entry = find_entry(catalog, project_name)
+    catalog = [e for e in catalog if e["project_name"] != project_name]
+    save_catalog(catalog)
+    if entry:
+        storage.delete_object(entry["key"])
+    return catalog
@@ -0,0 +1,127 @@
+"""Ligne de commande : rapports de planning hebdomadaires et export des annotations.
+
+Exemples ::
+
+    python -m buildozair report --output-dir rapports --workers 8
+    python -m buildozair export --format parquet -o annotations.parquet
+"""
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+from . import catalog, storage
+from .annotations import EXPORT_FORMATS, export_annotations
+from .images import RasterStore
+from .reports import build_planning_report
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _init_worker():
+    # Chaque processus crée son propre client S3 (les clients boto3 ne se partagent pas après un fork)
+    storage.get_s3_client.cache_clear()
+
+
+def _report_worker(entry, start, end, output_dir, raster_dir):
+    # Le projet est chargé dans le processus de travail : seule l'entrée de catalogue transite
+    project = catalog.load_project(entry)
+    pdf = build_planning_report(project, start, end, storage.download_file, RasterStore(raster_dir))
+    if pdf is None:
+        return None
+    path = os.path.join(output_dir, f"planning_{catalog.project_slug(project['project_name'])}_{start.isoformat()}.pdf")
+    with open(path, "wb") as f:
+        f.write(pdf.getbuffer())
+    return path
+
+
+def run_reports(entries, start, end, output_dir, workers=None, raster_dir=None):
+    """Génère un PDF par projet du catalogue en parallèle ; renvoie (générés, ignorés, échecs)."""
+    os.makedirs(output_dir, exist_ok=True)
+    raster_dir = RasterStore(raster_dir).root
+    generated, skipped, failed = [], [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(_report_worker, e, start, end, output_dir, raster_dir): e["project_name"]
+                   for e in entries}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                path = future.result()
+            except Exception as e:
+                logger.error("Échec du rapport pour %s : %s", name, e)
+                failed.append(name)
+                continue
+            if path is None:
+                logger.info("Aucune tâche pour %s sur la période, rapport ignoré.", name)
+                skipped.append(name)
+            else:
+                logger.info("Rapport généré pour %s : %s", name, path)
+                generated.append(path)
+    return generated, skipped, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="buildozair", description="Outils BuildozAir hors navigateur.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    report = sub.add_parser("report", help="Rapports PDF de planning pour tous les projets.")
+    monday = date.today() - timedelta(days=date.today().weekday())
+    report.add_argument("--start", type=_parse_date, default=monday,
+                        help="Début de période AAAA-MM-JJ (défaut : lundi de la semaine en cours).")
+    report.add_argument("--end", type=_parse_date, default=None,
+                        help="Fin de période AAAA-MM-JJ (défaut : début + 6 jours).")
+    report.add_argument("--project", action="append", dest="projects",
+                        help="Limiter à ce projet (option répétable).")
+    report.add_argument("--output-dir", default="rapports")
+    report.add_argument("--workers", type=int, default=None,
+                        help="Nombre de processus (défaut : nombre de cœurs).")
+    report.add_argument("--raster-dir", default=None,
+                        help="Répertoire du store des plans décodés, partagé entre processus "
+                             "(défaut : $BUILDOZAIR_RASTER_DIR ou le répertoire temporaire).")
+
+    export = sub.add_parser("export", help="Exporte les annotations d'un ou de tous les projets.")
+    export.add_argument("--format", choices=sorted(EXPORT_FORMATS.values()), default="csv")
+    export.add_argument("--project", action="append", dest="projects",
+                        help="Limiter à ce projet (option répétable).")
+    export.add_argument("-o", "--output", required=True, help="Fichier de sortie.")
+
+    sub.add_parser("migrate", help="Crée le catalogue des projets depuis l'ancien annotations.json.")
+
+    args = parser.parse_args(argv)
+    if args.command == "report" and args.end is not None and args.end < args.start:
+        parser.error("--end doit être postérieure ou égale à --start.")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "migrate":
+        if catalog.read_catalog() is not None:
+            print("Le catalogue existe déjà, rien à migrer.")
+            return 0
+        entries = catalog.migrate_legacy_annotations()
+        print(f"{len(entries)} projet(s) migré(s) vers le catalogue.")
+        return 0
+
+    # Lecture seule : un rapport ou un export ne doit jamais modifier le stockage
+    entries = catalog.read_catalog()
+    if entries is None:
+        logger.error("Catalogue des projets absent : lancez d'abord `python -m buildozair migrate`.")
+        return 2
+    if args.projects:
+        entries = [e for e in entries if e["project_name"] in args.projects]
+
+    if args.command == "export":
+        # Écriture directe dans le fichier, un bloc à la fois et un projet chargé à la fois
+        with open(args.output, "wb") as f:
+            n_rows = export_annotations(catalog.iter_projects(entries), args.format, f)
+        print(f"{n_rows} annotation(s) exportée(s) dans {args.output}.")
+        return 0
+
+    end = args.end or args.start + timedelta(days=6)
+    generated, skipped, failed = run_reports(entries, args.start, end, args.output_dir,
+                                             workers=args.workers, raster_dir=args.raster_dir)
+    print(f"{len(generated)} rapport(s) généré(s), {len(skipped)} ignoré(s), {len(failed)} échec(s).")
+    return 1 if failed else 0
@@ -0,0 +1,194 @@
+"""Chargement des plans (PDF / images) et dessin des annotations."""
+import hashlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# PDF → Image
+from pdf2image import convert_from_bytes
+from pdf2image.exceptions import PDFInfoNotInstalledError
+import fitz  # PyMuPDF fallback
+
+PDF_DPI = 150
+MAP_PREVIEW_SIDE = 2048
+RASTER_STORE_MAX_BYTES = int(os.getenv("BUILDOZAIR_RASTER_MAX_BYTES", 5 * 1024 ** 3))
+STALE_TMP_SECONDS = 3600
+
+
+def load_image_from_bytes(uploaded_bytes, name, page=0):
+    """Décode un plan (page `page` pour un PDF). Lève une exception si le fichier est illisible."""
+    if name.lower().endswith(".pdf"):
+        try:
+            pages = convert_from_bytes(uploaded_bytes, dpi=PDF_DPI, first_page=page + 1, last_page=page + 1)
+            return pages[0]
+        except PDFInfoNotInstalledError:
+            doc = fitz.open(stream=uploaded_bytes, filetype="pdf")
+            pix = doc.load_page(page).get_pixmap()
+            return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    return Image.open(io.BytesIO(uploaded_bytes))
+
+
+class RasterStore:
+    """Plans décodés conservés une seule fois sur disque (tableaux uint8 H×W×3 au format .npy).
+
+    La clé est l'empreinte SHA-256 du fichier source et le numéro de page. Les lectures
+    passent par np.load(mmap_mode="r") : sessions et processus de travail obtiennent des
+    vues en lecture seule sur les mêmes pages du cache système, sans copie du plan entier.
+    Un recadrage (region) ne lit que les lignes concernées ; les cartes utilisent un aperçu
+    réduit (preview) dont la taille ne dépend pas du plan.
+    Au-delà de `max_bytes`, les fichiers les moins récemment lus sont supprimés.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.getenv("BUILDOZAIR_RASTER_DIR") or os.path.join(tempfile.gettempdir(),
+                                                                                "buildozair-rasters")
+        self.max_bytes = max_bytes if max_bytes is not None else RASTER_STORE_MAX_BYTES
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def content_key(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, key, page=0):
+        return os.path.join(self.root, f"{key}_p{page}.npy")
+
+    def preview_path(self, key, page, max_side, full_shape):
+        # Les dimensions du plan complet sont dans le nom : l'aperçu se suffit à lui-même
+        h, w = full_shape
+        return os.path.join(self.root, f"{key}_p{page}_s{max_side}_{h}x{w}.npy")
+
+    @staticmethod
+    def _load(path):
+        try:
+            # La date de modification sert d'horodatage de dernier accès pour l'éviction
+            os.utime(path)
+            arr = np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        # Vue ndarray sur le memmap (sans copie) : certaines bibliothèques, dont folium,
+        # ne reconnaissent que la classe ndarray
+        return arr.view(np.ndarray)
+
+    def open(self, key, page=0):
+        """Vue mémoire du plan déjà décodé, ou None s'il n'est pas dans le store."""
+        return self._load(self.path(key, page))
+
+    def get(self, data, name, page=0):
+        """Vue mémoire du plan `name` ; le décode et l'enregistre au premier accès."""
+        key = self.content_key(data)
+        arr = self.open(key, page)
+        if arr is None:
+            self.put(self.path(key, page), load_image_from_bytes(data, name, page))
+            arr = self.open(key, page)
+        return arr
+
+    def region(self, key, box, page=0):
+        """Recadrage (x0, y0, x1, y1) en pixels du plan `key`, lu sans toucher au reste de l'image.
+
+        Renvoie une vue mémoire (pas de copie), ou None si le plan n'est pas dans le store.
+        """
+        arr = self.open(key, page)
+        if arr is None:
+            return None
+        x0, y0, x1, y1 = box
+        return arr[max(y0, 0):y1, max(x0, 0):x1]
+
+    def preview(self, data, name, max_side=MAP_PREVIEW_SIDE, page=0):
+        """Aperçu du plan (plus grand côté ≤ `max_side`) et dimensions (h, w) du plan complet.
+
+        Un aperçu déjà présent suffit, même si le plan complet a été évincé : afficher un plan
+        A0 sur la carte ne coûte alors que quelques Mo, quelle que soit sa résolution.
+        """
+        key = self.content_key(data)
+        pattern = f"{key}_p{page}_s{max_side}_"
+        for entry in os.scandir(self.root):
+            if entry.name.startswith(pattern) and entry.name.endswith(".npy"):
+                arr = self._load(entry.path)
+                if arr is not None:
+                    h, w = entry.name[len(pattern):-len(".npy")].split("x")
+                    return arr, (int(h), int(w))
+        full = self.get(data, name, page)
+        img = Image.fromarray(np.asarray(full))
+        img.thumbnail((max_side, max_side))
+        path = self.preview_path(key, page, max_side, full.shape[:2])
+        self.put(path, img)
+        return self._load(path), full.shape[:2]
+
+    def put(self, path, pil_img):
+        # Écriture atomique : un autre processus ne lit jamais un fichier partiel
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.asarray(pil_img.convert("RGB"), dtype=np.uint8))
+        os.replace(tmp_path, path)
+        self.prune(keep=path)
+
+    def prune(self, keep=None):
+        """Supprime les plans les moins récemment lus jusqu'à repasser sous `max_bytes`.
+
+        Les fichiers temporaires abandonnés par une écriture interrompue sont aussi supprimés.
+        """
+        files = []
+        now = time.time()
+        for entry in os.scandir(self.root):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # Évincé entre-temps par un autre processus
+                continue
+            if entry.name.endswith(".tmp") and now - stat.st_mtime > STALE_TMP_SECONDS:
+                self._remove(entry.path)
+            elif entry.name.endswith(".npy") and entry.path != keep:
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files) + (os.path.getsize(keep) if keep else 0)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            # Sous POSIX, les vues déjà ouvertes sur ce fichier restent valides
+            os.remove(path)
+        except OSError:
+            pass
+
+    def image(self, data, name, page=0):
+        """Plan au format PIL (copie), pour les traitements qui dessinent dessus."""
+        return Image.fromarray(np.asarray(self.get(data, name, page)))
+
+
+def draw_annotations(pil_img, annotations):
+    """Copie RGB du plan avec les annotations dessinées (points rouges, rectangles bleus).
+
+    `annotations` est un DataFrame ou une liste de dicts aux coordonnées normalisées.
+    """
+    img = pil_img.convert("RGB")
+    draw = ImageDraw.Draw(img)
+    w, h = img.size
+    records = annotations.to_dict("records") if hasattr(annotations, "to_dict") else annotations
+    for ann in records:
+        x_pix = ann["x"] * w
+        # Inverser la coordonnée Y pour correspondre au système ReportLab
+        y_pix = (1 - ann["y"]) * h
+        if ann["type"] == "point":
+            r = 10
+            draw.ellipse(
+                [x_pix - r, y_pix - r, x_pix + r, y_pix + r],
+                fill="red",
+                outline="black"
+            )
+        else:
+            w_px = ann["width"] * w
+            h_px = ann["height"] * h
+            # Ajuster le rectangle avec l'inversion Y correcte
+            y_top = y_pix  # Coin supérieur (inversé)
+            y_bottom = y_pix - h_px  # Coin inférieur
+            draw.rectangle([x_pix, y_bottom, x_pix + w_px, y_top],
+                           outline="blue", width=2)
+    return img
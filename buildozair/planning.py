@@ -0,0 +1,158 @@
+"""Index des échéances et agrégats de planning tenus à jour à chaque écriture.
+
+Les agrégats d'un projet sont stockés dans son entrée de catalogue (clé ``stats``) :
+
+- ``by_week`` : {lundi de la semaine d'échéance : {statut : nombre}}
+- ``by_category`` / ``by_intervenant`` : {valeur : {statut : nombre}}
+- ``open_due`` : {échéance : nombre de tâches non résolues}, d'où le nombre de tâches
+  en retard à n'importe quelle date sans recharger le projet.
+"""
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .annotations import ANNOTATION_FIELDS
+
+RESOLVED_STATUS = "Résolu"
+STATS_KEYS = ("by_week", "by_category", "by_intervenant", "open_due")
+
+
+def _parse_due(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_day(value):
+    return np.datetime64(pd.Timestamp(value).date(), "D")
+
+
+def week_start(day):
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def empty_stats():
+    return {key: {} for key in STATS_KEYS}
+
+
+def _bump(table, key, status, delta):
+    counts = table.setdefault(key, {})
+    counts[status] = counts.get(status, 0) + delta
+    if counts[status] <= 0:
+        del counts[status]
+    if not counts:
+        del table[key]
+
+
+def apply_annotation(stats, ann, delta=1):
+    """Ajoute (delta=1) ou retire (delta=-1) une annotation des agrégats, en place."""
+    status = ann.get("status") or ""
+    _bump(stats["by_category"], ann.get("category") or "", status, delta)
+    _bump(stats["by_intervenant"], ann.get("intervenant") or "", status, delta)
+    due = _parse_due(ann.get("due_date"))
+    if due is not None:
+        _bump(stats["by_week"], week_start(due), status, delta)
+        if status != RESOLVED_STATUS:
+            open_due = stats["open_due"]
+            open_due[due.isoformat()] = open_due.get(due.isoformat(), 0) + delta
+            if open_due[due.isoformat()] <= 0:
+                del open_due[due.isoformat()]
+    return stats
+
+
+def apply_frame(stats, df, delta=1):
+    """Version groupée d'apply_annotation pour un lot d'annotations (import en masse)."""
+    if df.empty:
+        return stats
+    df = df.assign(status=df["status"].fillna(""), category=df["category"].fillna(""),
+                   intervenant=df["intervenant"].fillna(""))
+    for column, table in (("category", "by_category"), ("intervenant", "by_intervenant")):
+        for (key, status), n in df.groupby([column, "status"]).size().items():
+            _bump(stats[table], key, status, delta * int(n))
+    due = pd.to_datetime(df["due_date"], format="%Y-%m-%d", errors="coerce")
+    dated = df.assign(due=due)[due.notna()]
+    weeks = (dated["due"] - pd.to_timedelta(dated["due"].dt.weekday, unit="D")).dt.strftime("%Y-%m-%d")
+    for (week, status), n in dated.assign(week=weeks).groupby(["week", "status"]).size().items():
+        _bump(stats["by_week"], week, status, delta * int(n))
+    open_due = stats["open_due"]
+    for day, n in dated[dated["status"] != RESOLVED_STATUS]["due"].dt.strftime("%Y-%m-%d").value_counts().items():
+        open_due[day] = open_due.get(day, 0) + delta * int(n)
+        if open_due[day] <= 0:
+            del open_due[day]
+    return stats
+
+
+def project_stats(project):
+    """Agrégats calculés entièrement (nouvelle entrée de catalogue ou entrée antérieure aux agrégats)."""
+    stats = empty_stats()
+    for img in project.get("images", []):
+        for ann in img.get("annotations", []):
+            apply_annotation(stats, ann)
+    return stats
+
+
+def overdue_count(stats, today=None):
+    today = (today or date.today()).isoformat()
+    return sum(n for day, n in stats["open_due"].items() if day < today)
+
+
+def status_totals(stats):
+    totals = {}
+    for counts in stats["by_category"].values():
+        for status, n in counts.items():
+            totals[status] = totals.get(status, 0) + n
+    return totals
+
+
+def stats_frame(stats, table):
+    """Tableau (lignes : clé de l'agrégat, colonnes : statuts) pour l'affichage."""
+    return pd.DataFrame.from_dict(stats[table], orient="index").fillna(0).astype(int).sort_index()
+
+
+class DueDateIndex:
+    """Annotations d'un projet triées par échéance : une plage de dates = deux recherches dichotomiques.
+
+    L'index est construit une fois par version du projet et ne doit pas être modifié.
+    """
+
+    def __init__(self, project):
+        self.project = project
+        refs = [(i, j) for i, img in enumerate(project.get("images", []))
+                for j in range(len(img.get("annotations", [])))]
+        raw = [project["images"][i]["annotations"][j].get("due_date") for i, j in refs]
+        due = pd.to_datetime(pd.Series(raw, dtype="object"), format="%Y-%m-%d",
+                             errors="coerce").to_numpy("datetime64[D]")
+        dated = ~np.isnat(due)
+        order = np.argsort(due[dated], kind="stable")
+        self.dates = due[dated][order]
+        self.refs = np.asarray(refs, dtype=np.int64).reshape(-1, 2)[dated][order]
+
+    def __len__(self):
+        return len(self.dates)
+
+    def positions(self, start=None, end=None):
+        """Couples (index du plan, index de l'annotation) dont l'échéance est dans [start, end]."""
+        lo = 0 if start is None else np.searchsorted(self.dates, _as_day(start), side="left")
+        hi = len(self.dates) if end is None else np.searchsorted(self.dates, _as_day(end), side="right")
+        return self.refs[lo:hi]
+
+    def frame(self, start=None, end=None, positions=None):
+        """Annotations de la plage, dans l'ordre des échéances, au format d'annotations_frame."""
+        if positions is None:
+            positions = self.positions(start, end)
+        images = self.project["images"]
+        records = [dict(images[i]["annotations"][j], image_name=images[i]["image_name"]) for i, j in positions]
+        df = pd.DataFrame(records, columns=ANNOTATION_FIELDS + ["image_name"])
+        df["due_date"] = pd.to_datetime(df["due_date"], errors="coerce")
+        return df
+
+    def overdue(self, today=None):
+        """Tâches non résolues dont l'échéance est passée."""
+        end = (today or date.today()) - timedelta(days=1)
+        positions = self.positions(end=end)
+        images = self.project["images"]
+        open_mask = np.array([images[i]["annotations"][j].get("status") != RESOLVED_STATUS for i, j in positions],
+                             dtype=bool)
+        return self.frame(positions=positions[open_mask])
@@ -0,0 +1,137 @@
+"""Génération du rapport PDF de planning (plan annoté + tableaux)."""
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle, Image as RLImage
+from reportlab.lib import colors
+
+from .annotations import annotations_frame
+from .images import draw_annotations, load_image_from_bytes
+from .planning import DueDateIndex
+
+
+def generate_planning_pdf(pil_img, df_all_annotations, df_plan, start_date, end_date):
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=landscape(A4))
+    width, height = landscape(A4)
+
+    # --- PAGE 1 : plan annoté plein cadre ---
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(width/2, height - 40, "Plan annoté")
+    c.setFont("Helvetica", 12)
+    subtitle = f"Période : {start_date.strftime('%Y-%m-%d')} → {end_date.strftime('%Y-%m-%d')}"
+    c.drawCentredString(width/2, height - 60, subtitle)
+
+    # 1) On passe l'image PIL en buffer PNG (sans inversion)
+    img_buffer = BytesIO()
+    pil_img.save(img_buffer, format="PNG")
+    img_buffer.seek(0)
+
+    # 2) On calcule la taille dans le PDF (90% de la largeur, ratio conservé)
+    img_w = width * 0.9
+    img_h = img_w * (pil_img.height / pil_img.width)
+    max_img_h = height - 120
+    if img_h > max_img_h:
+        img_h = max_img_h
+        img_w = img_h * (pil_img.width / pil_img.height)
+    x_img = (width - img_w) / 2
+    y_img = height - 100 - img_h
+
+    # 3) On dessine l'image (déjà annotée)
+    RLImage(img_buffer, width=img_w, height=img_h).drawOn(c, x_img, y_img)
+
+    # 4) Optionnel : cadre autour de l'image
+    c.rect(x_img, y_img, img_w, img_h, stroke=1, fill=0)
+
+    # pied de page
+    c.setFont("Helvetica", 8)
+    c.drawRightString(width - 20, 10, "Page 1/2")
+    c.showPage()
+
+    # --- PAGE 2 : tableaux ---
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(width/2, height - 40, "Détails des annotations et planning")
+
+    margin = 20
+    y = height - 80
+
+    # 1) Toutes les annotations
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(margin, y, "1) Toutes les annotations")
+    y -= 20
+
+    data1 = [["Timestamp", "Catégorie", "Intervenant", "Commentaire", "Statut", "Échéance"]]
+    for _, r in df_all_annotations.iterrows():
+        data1.append([
+            str(r["timestamp"]),
+            r["category"],
+            r["intervenant"],
+            r["comment"],
+            r["status"],
+            r["due_date"].date().isoformat()
+        ])
+    tbl1 = Table(data1, colWidths=[80, 60, 60, 180, 60, 60])
+    tbl1.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+    ]))
+    w1, h1 = tbl1.wrapOn(c, width - 2 * margin, y)
+    tbl1.drawOn(c, margin, y - h1)
+    y -= h1 + 40
+
+    # 2) Planning filtré
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(margin, y, "2) Planning des tâches")
+    y -= 20
+
+    data2 = [["Timestamp", "Catégorie", "Intervenant", "Commentaire", "Statut", "Échéance"]]
+    for _, r in df_plan.iterrows():
+        data2.append([
+            str(r["timestamp"]),
+            r["category"],
+            r["intervenant"],
+            r["comment"],
+            r["status"],
+            r["due_date"].date().isoformat()
+        ])
+    tbl2 = Table(data2, colWidths=[80, 60, 60, 180, 60, 60])
+    tbl2.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+    ]))
+    w2, h2 = tbl2.wrapOn(c, width - 2 * margin, y)
+    tbl2.drawOn(c, margin, y - h2)
+
+    c.setFont("Helvetica", 8)
+    c.drawRightString(width - 20, 10, "Page 2/2")
+
+    c.save()
+    buffer.seek(0)
+    return buffer
+
+
+def build_planning_report(project, start, end, fetch_bytes, raster_store=None, due_index=None):
+    """PDF de planning d'un projet pour les échéances entre `start` et `end` inclus.
+
+    `fetch_bytes(image_key)` renvoie le contenu du plan ; `raster_store` (RasterStore) évite
+    de redécoder un plan déjà rasterisé ; `due_index` évite de reconstruire
+    l'index des échéances s'il est déjà en cache. Renvoie None si aucune tâche ne tombe
+    dans la période ou si le projet n'a pas de plan.
+    """
+    if not project.get("images"):
+        return None
+    plan = (due_index or DueDateIndex(project)).frame(start, end)
+    if plan.empty:
+        return None
+    all_annotations = annotations_frame(project)
+    image_data = project["images"][0]
+    data = fetch_bytes(image_data["image_key"])
+    if raster_store is not None:
+        pil_img = raster_store.image(data, image_data["image_name"])
+    else:
+        pil_img = load_image_from_bytes(data, image_data["image_name"])
+    img = draw_annotations(pil_img, plan)
+    return generate_planning_pdf(img, all_annotations, plan, start, end)
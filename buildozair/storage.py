@@ -0,0 +1,130 @@
+"""Accès S3 : plans, photos et fichier des projets (sans dépendance Streamlit)."""
+import functools
+import io
+import json
+import logging
+import os
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# Configuration AWS S3
+AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
+AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+AWS_REGION = os.getenv("AWS_DEFAULT_REGION", "eu-north-1")
+S3_BUCKET_NAME = "jujul"
+S3_PREFIX = "buildozair/"
+S3_ANNOTATIONS_KEY = f"{S3_PREFIX}annotations.json"  # ancien format : tous les projets dans un seul fichier
+S3_CATALOG_KEY = f"{S3_PREFIX}catalog.json.gz"
+S3_PROJECTS_PREFIX = f"{S3_PREFIX}projects/"
+
+
+@functools.lru_cache(maxsize=None)
+def get_s3_client():
+    """Client S3 créé à la première utilisation (un par processus)."""
+    return boto3.client(
+        "s3",
+        region_name=AWS_REGION,
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+    )
+
+
+def check_bucket():
+    get_s3_client().head_bucket(Bucket=S3_BUCKET_NAME)
+
+
+def full_key(file_key):
+    if file_key and not file_key.startswith(S3_PREFIX):
+        return S3_PREFIX + file_key
+    return file_key
+
+
+def upload_file(file_name, file_content):
+    if not file_content:
+        raise ValueError(f"Contenu vide pour {file_name}.")
+    s3_key = S3_PREFIX + file_name
+    get_s3_client().upload_fileobj(io.BytesIO(file_content), S3_BUCKET_NAME, s3_key)
+    return s3_key
+
+
+def download_file(file_key):
+    response = get_s3_client().get_object(Bucket=S3_BUCKET_NAME, Key=full_key(file_key))
+    return response['Body'].read()
+
+
+def read_object(key):
+    """Contenu brut de `key`, ou None si l'objet n'existe pas."""
+    client = get_s3_client()
+    try:
+        response = client.get_object(Bucket=S3_BUCKET_NAME, Key=key)
+    except client.exceptions.NoSuchKey:
+        return None
+    return response['Body'].read()
+
+
+def write_object(key, data):
+    get_s3_client().upload_fileobj(io.BytesIO(data), S3_BUCKET_NAME, key)
+
+
+def delete_object(file_key):
+    get_s3_client().delete_object(Bucket=S3_BUCKET_NAME, Key=file_key)
+
+
+def presigned_url(file_key, expires_in=3600):
+    return get_s3_client().generate_presigned_url(
+        'get_object',
+        Params={'Bucket': S3_BUCKET_NAME, 'Key': file_key},
+        ExpiresIn=expires_in
+    )
+
+
+def load_projects():
+    """Lit l'ancien fichier annotations.json (utilisé uniquement pour migrer vers le catalogue)."""
+    data = read_object(S3_ANNOTATIONS_KEY)
+    if data is None:
+        return []
+    return json.loads(data.decode('utf-8'))
+
+
+def migrate_legacy_images(projects):
+    """Migre les anciens plans (clé sans préfixe ou chemin local) vers S3.
+
+    Renvoie (modifié, messages) : `modifié` indique s'il faut ré-enregistrer les projets,
+    `messages` contient les avertissements à afficher.
+    """
+    changed = False
+    messages = []
+    for project in projects:
+        for image in project.get("images", []):
+            if "image_key" in image and not image["image_key"].startswith(S3_PREFIX):
+                old_key = image["image_key"]
+                try:
+                    uploaded_bytes = download_file(old_key)
+                    if uploaded_bytes:
+                        upload_file(old_key, uploaded_bytes)
+                        delete_object(old_key)
+                        image["image_key"] = S3_PREFIX + old_key
+                        changed = True
+                except Exception as e:
+                    messages.append(f"Erreur lors de la migration de {old_key} : {e}")
+            elif "image_path" in image and "image_key" not in image:
+                image_path = image["image_path"]
+                if not os.path.exists(image_path):
+                    messages.append(f"Chemin {image_path} introuvable pour migration.")
+                    continue
+                try:
+                    with open(image_path, "rb") as f:
+                        image_content = f.read()
+                    if not image_content:
+                        messages.append(f"Contenu vide pour l'image {image['image_name']} au chemin {image_path}.")
+                        continue
+                    image["image_key"] = upload_file(image["image_name"], image_content)
+                    del image["image_path"]
+                    changed = True
+                except Exception as e:
+                    messages.append(f"Échec de la migration de l'image {image['image_name']} vers S3 : {e}")
+    for message in messages:
+        logger.warning(message)
+    return changed, messages
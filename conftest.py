@@ -0,0 +1 @@
+# Présent à la racine pour que pytest y ajoute le dépôt au sys.path (import de buildozair).
@@ -1,49 +1,31 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
+import altair as alt
 import folium
 from folium.plugins import Draw
 from streamlit_folium import st_folium
 from datetime import datetime
-from PIL import Image, ImageDraw
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Table, TableStyle, Image as RLImage
-from reportlab.lib import colors
-import io, os, json
-from io import BytesIO
+import copy
 import os.path
-
-# PDF → Image
-from pdf2image import convert_from_bytes
-from pdf2image.exceptions import PDFInfoNotInstalledError
-import fitz  # PyMuPDF fallback
-
-# Amazon S3
-import boto3
+import tempfile
 
 # OneDrive / Microsoft Graph
 import msal, requests
 
+from buildozair import storage
+from buildozair import catalog as project_catalog
+from buildozair import images as plan_images
+from buildozair import planning
+from buildozair.annotations import (CATEGORIES, INTERVENANTS, STATUSES, EXPORT_COLUMNS, EXPORT_FORMATS,
+                                    make_annotation, export_annotations, read_annotations_file,
+                                    validate_annotations_df, import_annotations)
+from buildozair.reports import build_planning_report
+
 # Configuration globale
 st.set_page_config(page_title="BuildozAir Simplifié", layout="wide")
 
-# Configuration AWS S3
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-AWS_REGION = os.getenv("AWS_DEFAULT_REGION", "eu-north-1")
-S3_BUCKET_NAME = "jujul"
-S3_PREFIX = "buildozair/"
-S3_ANNOTATIONS_KEY = f"{S3_PREFIX}annotations.json"
-
 try:
-    s3_client = boto3.client(
-        "s3",
-        region_name=AWS_REGION,
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    )
-    s3_client.head_bucket(Bucket=S3_BUCKET_NAME)
+    storage.check_bucket()
 except Exception as e:
     st.error(f"Erreur de configuration S3 : {e}. Vérifiez vos credentials et le bucket.")
     st.stop()
@@ -51,12 +33,7 @@ except Exception as e:
 
 def upload_to_s3(file_name, file_content):
     try:
-        if not file_content or len(file_content) == 0:
-            st.error(f"Contenu vide pour {file_name}.")
-            return None
-        s3_key = S3_PREFIX + file_name
-        s3_client.upload_fileobj(io.BytesIO(file_content), S3_BUCKET_NAME, s3_key)
-        return s3_key
+        return storage.upload_file(file_name, file_content)
     except Exception as e:
         st.error(f"Erreur lors du téléversement de {file_name} sur S3 : {e}")
         return None
@@ -64,81 +41,100 @@ def upload_to_s3(file_name, file_content):
 
 def download_from_s3(file_key):
     try:
-        if file_key and not file_key.startswith(S3_PREFIX):
-            file_key = S3_PREFIX + file_key
-        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=file_key)
-        return response['Body'].read()
+        return storage.download_file(file_key)
     except Exception as e:
         st.error(f"Erreur lors du téléchargement de {file_key} depuis S3 : {e}")
         return None
 
 
-def load_projects_from_s3():
+def load_catalog():
+    """Catalogue des projets, ou None si S3 n'a pas pu être lu (à distinguer d'un catalogue vide)."""
     try:
-        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=S3_ANNOTATIONS_KEY)
-        projects = json.loads(response['Body'].read().decode('utf-8'))
-        return projects
-    except s3_client.exceptions.NoSuchKey:
-        return []
+        return project_catalog.ensure_stats(project_catalog.load_catalog())
     except Exception as e:
         st.error(f"Erreur lors du chargement des projets depuis S3 : {e}")
-        return []
+        return None
+
 
+def save_projects_to_s3(projects, stats=None):
+    """Enregistre les projets modifiés (copies éditables) et met à jour le catalogue de la session.
 
-def save_projects_to_s3(projects):
+    `stats` : {nom du projet : agrégats de planning déjà mis à jour}, voir current_stats.
+    """
     try:
-        s3_client.upload_fileobj(
-            io.BytesIO(json.dumps(projects, indent=2).encode('utf-8')),
-            S3_BUCKET_NAME,
-            S3_ANNOTATIONS_KEY
-        )
+        st.session_state["catalog"] = project_catalog.save_projects(projects, stats=stats)
+        return True
     except Exception as e:
         st.error(f"Erreur lors de la sauvegarde des projets sur S3 : {e}")
+        return False
 
 
-# Charger les projets depuis S3 au démarrage
-if "projects" not in st.session_state:
-    st.session_state["projects"] = load_projects_from_s3()
+@st.cache_resource(max_entries=64, show_spinner=False)
+def get_shared_project(key, etag):
+    """Projet décodé, partagé en lecture seule par toutes les sessions (une entrée par version)."""
+    return project_catalog.load_project({"key": key})
 
-# Migration des anciennes données
-for project in st.session_state["projects"]:
-    for image in project.get("images", []):
-        if "image_key" in image and not image["image_key"].startswith(S3_PREFIX):
-            old_key = image["image_key"]
-            new_key = S3_PREFIX + old_key
-            try:
-                uploaded_bytes = download_from_s3(old_key)
-                if uploaded_bytes:
-                    upload_to_s3(old_key, uploaded_bytes)
-                    s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=old_key)
-                    image["image_key"] = new_key
-            except Exception as e:
-                st.error(f"Erreur lors de la migration de {old_key} : {e}")
-        elif "image_path" in image and "image_key" not in image:
-            image_path = image["image_path"]
-            if os.path.exists(image_path):
-                try:
-                    with open(image_path, "rb") as f:
-                        image_content = f.read()
-                    if image_content:
-                        image_key = upload_to_s3(image["image_name"], image_content)
-                        if image_key:
-                            image["image_key"] = image_key
-                            del image["image_path"]
-                        else:
-                            st.warning(f"Échec de la migration de l'image {image['image_name']} vers S3.")
-                    else:
-                        st.warning(f"Contenu vide pour l'image {image['image_name']} au chemin {image_path}.")
-                except Exception as e:
-                    st.error(f"Erreur lors de la lecture de {image_path} : {e}")
-            else:
-                st.warning(f"Chemin {image_path} introuvable pour migration.")
-save_projects_to_s3(st.session_state["projects"])
 
-if not st.session_state["projects"] or not any("project_name" in proj for proj in st.session_state["projects"]):
-    st.session_state["projects"] = [{"project_name": "Projet par défaut", "images": []}]
-if "selected_project" not in st.session_state:
-    st.session_state["selected_project"] = st.session_state["projects"][0]["project_name"]
+def create_project(project):
+    """Crée un projet sans jamais écraser un projet existant du même nom."""
+    try:
+        st.session_state["catalog"] = project_catalog.create_project(project)
+        return True
+    except Exception as e:
+        st.error(f"Impossible de créer le projet {project['project_name']} : {e}")
+        return False
+
+
+def get_project(project_name):
+    """Projet en lecture seule : passer par copy.deepcopy avant toute modification.
+
+    En cas d'erreur l'exécution de la page s'arrête, pour qu'aucune écriture ne parte
+    d'un projet incomplet.
+    """
+    entry = project_catalog.find_entry(st.session_state["catalog"], project_name)
+    if entry is None:
+        st.error(f"Projet {project_name} introuvable dans le catalogue.")
+        st.stop()
+    try:
+        return get_shared_project(entry["key"], entry["etag"])
+    except Exception as e:
+        st.error(f"Erreur lors du chargement du projet {project_name} : {e}")
+        st.stop()
+
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def get_shared_due_index(key, etag):
+    return planning.DueDateIndex(get_shared_project(key, etag))
+
+
+def get_due_index(project_name):
+    entry = project_catalog.find_entry(st.session_state["catalog"], project_name)
+    if entry is None:
+        return planning.DueDateIndex({"images": []})
+    return get_shared_due_index(entry["key"], entry["etag"])
+
+
+def current_stats(project_name):
+    """Copie modifiable des agrégats de planning du projet, à mettre à jour avant save_projects_to_s3."""
+    entry = project_catalog.find_entry(st.session_state["catalog"], project_name)
+    if entry is None:
+        return planning.empty_stats()
+    return copy.deepcopy(project_catalog.entry_stats(entry))
+
+
+# Charger le catalogue des projets au démarrage (les projets eux-mêmes sont chargés à la sélection)
+# Après un échec de lecture, le catalogue reste vide pour cette exécution et sera relu à la suivante
+if not st.session_state.get("catalog_loaded"):
+    loaded = load_catalog()
+    st.session_state["catalog"] = loaded if loaded is not None else []
+    st.session_state["catalog_loaded"] = loaded is not None
+    # Projet par défaut uniquement si S3 a répondu et ne contient vraiment aucun projet
+    if loaded == []:
+        create_project({"project_name": "Projet par défaut", "images": []})
+
+project_names = [entry["project_name"] for entry in st.session_state["catalog"]]
+if st.session_state.get("selected_project") not in project_names + ["Nouveau projet"]:
+    st.session_state["selected_project"] = project_names[0] if project_names else "Nouveau projet"
 if "drawn_feats_count" not in st.session_state:
     st.session_state["drawn_feats_count"] = 0
 if "current_annotation" not in st.session_state:
@@ -169,142 +165,34 @@ def list_onedrive_files():
     return resp.json().get("value", [])
 
 
-def generate_planning_pdf(pil_img, df_all_annotations, df_plan, start_date, end_date):
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=landscape(A4))
-    width, height = landscape(A4)
-
-    # --- PAGE 1 : plan annoté plein cadre ---
-    c.setFont("Helvetica-Bold", 16)
-    c.drawCentredString(width/2, height - 40, "Plan annoté")
-    c.setFont("Helvetica", 12)
-    subtitle = f"Période : {start_date.strftime('%Y-%m-%d')} → {end_date.strftime('%Y-%m-%d')}"
-    c.drawCentredString(width/2, height - 60, subtitle)
-
-    # 1) On passe l'image PIL en buffer PNG (sans inversion)
-    img_buffer = BytesIO()
-    pil_img.save(img_buffer, format="PNG")
-    img_buffer.seek(0)
-
-    # 2) On calcule la taille dans le PDF (90% de la largeur, ratio conservé)
-    img_w = width * 0.9
-    img_h = img_w * (pil_img.height / pil_img.width)
-    max_img_h = height - 120
-    if img_h > max_img_h:
-        img_h = max_img_h
-        img_w = img_h * (pil_img.width / pil_img.height)
-    x_img = (width - img_w) / 2
-    y_img = height - 100 - img_h
-
-    # 3) On dessine l'image (déjà annotée)
-    RLImage(img_buffer, width=img_w, height=img_h).drawOn(c, x_img, y_img)
-
-    # 4) Optionnel : cadre autour de l'image
-    c.rect(x_img, y_img, img_w, img_h, stroke=1, fill=0)
-
-    # pied de page
-    c.setFont("Helvetica", 8)
-    c.drawRightString(width - 20, 10, "Page 1/2")
-    c.showPage()
-
-    # --- PAGE 2 : tableaux ---
-    c.setFont("Helvetica-Bold", 16)
-    c.drawCentredString(width/2, height - 40, "Détails des annotations et planning")
-
-    margin = 20
-    y = height - 80
-
-    # 1) Toutes les annotations
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(margin, y, "1) Toutes les annotations")
-    y -= 20
-
-    data1 = [["Timestamp", "Catégorie", "Intervenant", "Commentaire", "Statut", "Échéance"]]
-    for _, r in df_all_annotations.iterrows():
-        data1.append([
-            str(r["timestamp"]),
-            r["category"],
-            r["intervenant"],
-            r["comment"],
-            r["status"],
-            r["due_date"].date().isoformat()
-        ])
-    tbl1 = Table(data1, colWidths=[80, 60, 60, 180, 60, 60])
-    tbl1.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-    ]))
-    w1, h1 = tbl1.wrapOn(c, width - 2 * margin, y)
-    tbl1.drawOn(c, margin, y - h1)
-    y -= h1 + 40
-
-    # 2) Planning filtré
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(margin, y, "2) Planning des tâches")
-    y -= 20
-
-    data2 = [["Timestamp", "Catégorie", "Intervenant", "Commentaire", "Statut", "Échéance"]]
-    for _, r in df_plan.iterrows():
-        data2.append([
-            str(r["timestamp"]),
-            r["category"],
-            r["intervenant"],
-            r["comment"],
-            r["status"],
-            r["due_date"].date().isoformat()
-        ])
-    tbl2 = Table(data2, colWidths=[80, 60, 60, 180, 60, 60])
-    tbl2.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-    ]))
-    w2, h2 = tbl2.wrapOn(c, width - 2 * margin, y)
-    tbl2.drawOn(c, margin, y - h2)
-
-    c.setFont("Helvetica", 8)
-    c.drawRightString(width - 20, 10, "Page 2/2")
-
-    c.save()
-    buffer.seek(0)
-    return buffer
-
-
-def load_image_from_bytes(uploaded_bytes, name):
+@st.cache_resource(show_spinner=False)
+def get_raster_store():
+    return plan_images.RasterStore()
+
+
+def load_map_raster(uploaded_bytes, name):
+    """Aperçu réduit du plan pour la carte (vue mémoire partagée) et dimensions (h, w) du plan complet."""
     try:
-        if name.lower().endswith(".pdf"):
-            try:
-                pages = convert_from_bytes(uploaded_bytes, dpi=150)
-                return pages[0]
-            except PDFInfoNotInstalledError:
-                doc = fitz.open(stream=uploaded_bytes, filetype="pdf")
-                pix = doc.load_page(0).get_pixmap()
-                return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        else:
-            return Image.open(io.BytesIO(uploaded_bytes))
+        return get_raster_store().preview(uploaded_bytes, name)
     except Exception as e:
         st.error(f"Erreur chargement image : {e}")
-        return None
+        return None, None
 
 
 def delete_project(project_name):
-    st.session_state["projects"] = [p for p in st.session_state["projects"] if p["project_name"] != project_name]
-    save_projects_to_s3(st.session_state["projects"])
+    try:
+        st.session_state["catalog"] = project_catalog.delete_project(project_name)
+    except Exception as e:
+        st.error(f"Erreur lors de la suppression du projet {project_name} : {e}")
     if st.session_state["selected_project"] == project_name:
-        st.session_state["selected_project"] = st.session_state["projects"][0]["project_name"] if st.session_state[
-            "projects"] else "Projet par défaut"
+        st.session_state["selected_project"] = st.session_state["catalog"][0]["project_name"] if st.session_state[
+            "catalog"] else "Projet par défaut"
     st.rerun()
 
 
 def generate_s3_url(file_key):
     try:
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': S3_BUCKET_NAME, 'Key': file_key},
-            ExpiresIn=3600
-        )
-        return url
+        return storage.presigned_url(file_key)
     except Exception as e:
         st.error(f"Erreur lors de la génération du lien pour {file_key} : {e}")
         return None
@@ -312,12 +200,11 @@ def generate_s3_url(file_key):
 
 # Pages
 st.sidebar.title("Navigation")
-page = st.sidebar.radio("Aller à", ["Annoter", "Gérer", "Planning"])
+page = st.sidebar.radio("Aller à", ["Annoter", "Gérer", "Planning", "Import / Export"])
 
 if page == "Annoter":
     st.header("Annoter le plan")
-    project_names = [proj["project_name"] for proj in st.session_state["projects"] if "project_name" in proj]
-    project_names.append("Nouveau projet")
+    project_names = project_names + ["Nouveau projet"]
     selected_project = st.selectbox("Sélectionnez un projet", project_names,
                                     index=project_names.index(st.session_state["selected_project"]))
     st.session_state["selected_project"] = selected_project
@@ -327,12 +214,14 @@ if page == "Annoter":
     image_key = None
 
     if selected_project == "Nouveau projet":
-        new_project_name = st.text_input("Nom du nouveau projet")
+        new_project_name = st.text_input("Nom du nouveau projet").strip()
+        if new_project_name in project_names:
+            st.error("Un projet porte déjà ce nom : choisissez-en un autre.")
+            new_project_name = ""
         if st.button("Créer le projet") and new_project_name:
-            st.session_state["projects"].append({"project_name": new_project_name, "images": []})
-            save_projects_to_s3(st.session_state["projects"])
-            st.session_state["selected_project"] = new_project_name
-            st.rerun()
+            if create_project({"project_name": new_project_name, "images": []}):
+                st.session_state["selected_project"] = new_project_name
+                st.rerun()
         else:
             st.write("Veuillez uploader une nouvelle image pour ce projet.")
             source = st.radio("Source du plan", ["Local", "OneDrive"], disabled=not new_project_name)
@@ -355,18 +244,13 @@ if page == "Annoter":
 
             if uploaded_bytes and name and new_project_name:
                 image_key = upload_to_s3(name, uploaded_bytes)
-                if image_key:
-                    project_idx = next(i for i, proj in enumerate(st.session_state["projects"]) if
-                                       proj["project_name"] == new_project_name)
-                    st.session_state["projects"][project_idx]["images"].append(
-                        {"image_name": name, "image_key": image_key, "annotations": []})
-                    save_projects_to_s3(st.session_state["projects"])
+                if image_key and create_project({"project_name": new_project_name, "images": [
+                        {"image_name": name, "image_key": image_key, "annotations": []}]}):
+                    st.session_state["selected_project"] = new_project_name
                     st.rerun()
 
     else:
-        project_idx = next(
-            i for i, proj in enumerate(st.session_state["projects"]) if proj["project_name"] == selected_project)
-        project = st.session_state["projects"][project_idx]
+        project = get_project(selected_project)
         image_names = [img["image_name"] for img in project["images"]]
         image_names.append("Ajouter une nouvelle image")
         selected_image = st.selectbox("Sélectionnez une image", image_names, key=f"select_image_{selected_project}")
@@ -395,8 +279,9 @@ if page == "Annoter":
                 if image_key:
                     image_exists = any(img["image_name"] == name for img in project["images"])
                     if not image_exists:
+                        project = copy.deepcopy(project)
                         project["images"].append({"image_name": name, "image_key": image_key, "annotations": []})
-                        save_projects_to_s3(st.session_state["projects"])
+                        save_projects_to_s3([project], stats={selected_project: current_stats(selected_project)})
                         st.rerun()
         else:
             image_idx = next(i for i, proj in enumerate(project["images"]) if proj["image_name"] == selected_image)
@@ -411,9 +296,11 @@ if page == "Annoter":
                     if image_content:
                         image_key = upload_to_s3(name, image_content)
                         if image_key:
+                            project = copy.deepcopy(project)
+                            image_data = project["images"][image_idx]
                             image_data["image_key"] = image_key
                             del image_data["image_path"]
-                            save_projects_to_s3(st.session_state["projects"])
+                            save_projects_to_s3([project], stats={selected_project: current_stats(selected_project)})
                         else:
                             st.warning(f"Échec de la migration de {name} vers S3.")
                     else:
@@ -426,10 +313,10 @@ if page == "Annoter":
             uploaded_bytes = download_from_s3(image_key) if image_key else None
 
         if uploaded_bytes and name:
-            image = load_image_from_bytes(uploaded_bytes, name)
-            if image:
-                arr = np.array(image)
-                h, w = arr.shape[:2]
+            arr, full_shape = load_map_raster(uploaded_bytes, name)
+            if arr is not None:
+                # L'aperçu est étiré sur les dimensions du plan complet : les coordonnées ne changent pas
+                h, w = full_shape
                 m = folium.Map(location=[h / 2, w / 2], zoom_start=0, crs="Simple", min_zoom=-1, max_zoom=4,
                                width="100%", height=600)
                 folium.raster_layers.ImageOverlay(image=arr, bounds=[[0, 0], [h, w]], interactive=True,
@@ -499,20 +386,8 @@ if page == "Annoter":
                             width_norm = (x_max - x_min) / w
                             height_norm = (y_max - y_min) / h
                             ann_type = "rectangle"
-                        st.session_state["current_annotation"] = {
-                            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            "type": ann_type,
-                            "x": round(x_norm, 4),
-                            "y": round(y_norm, 4),
-                            "width": round(width_norm, 4),
-                            "height": round(height_norm, 4),
-                            "category": "Autre",
-                            "intervenant": "",
-                            "comment": "",
-                            "photo": None,
-                            "status": "À faire",
-                            "due_date": ""
-                        }
+                        st.session_state["current_annotation"] = make_annotation(
+                            ann_type, x_norm, y_norm, width_norm, height_norm)
                         st.session_state["last_drawings"] = current_drawings
                         st.rerun()
                     else:
@@ -520,20 +395,18 @@ if page == "Annoter":
 
                 if st.session_state["current_annotation"]:
                     st.sidebar.header("Détails de la nouvelle annotation")
-                    category = st.sidebar.selectbox("Catégorie", ["QHSE", "Qualité", "Planning", "Autre"],
-                                                    index=["QHSE", "Qualité", "Planning", "Autre"].index(
+                    category = st.sidebar.selectbox("Catégorie", CATEGORIES,
+                                                    index=CATEGORIES.index(
                                                         st.session_state["current_annotation"]["category"]))
-                    intervenant = st.sidebar.selectbox("Intervenant",
-                                                       ["Architecte", "Électricien", "Client", "Assistante"],
+                    intervenant = st.sidebar.selectbox("Intervenant", INTERVENANTS,
                                                        index=0 if not st.session_state["current_annotation"][
-                                                           "intervenant"] else ["Architecte", "Électricien", "Client",
-                                                                                "Assistante"].index(
+                                                           "intervenant"] else INTERVENANTS.index(
                                                            st.session_state["current_annotation"]["intervenant"]))
                     comment = st.sidebar.text_area("Commentaire",
                                                    value=st.session_state["current_annotation"]["comment"])
                     photo_file = st.sidebar.file_uploader("Ajouter une photo", type=["png", "jpg", "jpeg"])
-                    status = st.sidebar.selectbox("Statut", ["À faire", "En cours", "Résolu"],
-                                                  index=["À faire", "En cours", "Résolu"].index(
+                    status = st.sidebar.selectbox("Statut", STATUSES,
+                                                  index=STATUSES.index(
                                                       st.session_state["current_annotation"]["status"]))
                     due_date = st.sidebar.date_input("Échéance", value=datetime.strptime(
                         st.session_state["current_annotation"]["due_date"], "%Y-%m-%d") if
@@ -549,25 +422,25 @@ if page == "Annoter":
                         ann.update(
                             {"category": category, "intervenant": intervenant, "comment": comment, "photo": photo_path,
                              "status": status, "due_date": due_date.strftime("%Y-%m-%d")})
+                        project = copy.deepcopy(project)
                         image_idx = next(i for i, img in enumerate(project["images"]) if img["image_name"] == name)
                         project["images"][image_idx]["annotations"].append(ann)
-                        save_projects_to_s3(st.session_state["projects"])
+                        stats = planning.apply_annotation(current_stats(selected_project), ann)
+                        save_projects_to_s3([project], stats={selected_project: stats})
                         st.session_state["current_annotation"] = None
                         st.session_state["last_drawings"] = current_drawings
                         st.rerun()
 
 elif page == "Gérer":
     st.header("Gérer les annotations")
-    if not st.session_state["projects"]:
+    if not project_names:
         st.warning("Aucun projet existant.")
     else:
-        project_names = [proj["project_name"] for proj in st.session_state["projects"] if "project_name" in proj]
         selected_project = st.selectbox("Sélectionnez un projet", project_names,
-                                        index=project_names.index(st.session_state["selected_project"]))
+                                        index=project_names.index(st.session_state["selected_project"])
+                                        if st.session_state["selected_project"] in project_names else 0)
         st.session_state["selected_project"] = selected_project
-        project_idx = next(
-            i for i, proj in enumerate(st.session_state["projects"]) if proj["project_name"] == selected_project)
-        project = st.session_state["projects"][project_idx]
+        project = get_project(selected_project)
         if st.button("Supprimer ce projet"):
             delete_project(selected_project)
         if not project["images"]:
@@ -616,10 +489,9 @@ elif page == "Gérer":
                     # Carte interactive pour les annotations
                     uploaded_bytes = download_from_s3(image["image_key"]) if "image_key" in image else None
                     if uploaded_bytes:
-                        img = load_image_from_bytes(uploaded_bytes, image["image_name"])
-                        if img:
-                            arr = np.array(img)
-                            h, w = arr.shape[:2]
+                        arr, full_shape = load_map_raster(uploaded_bytes, image["image_name"])
+                        if arr is not None:
+                            h, w = full_shape
                             m = folium.Map(location=[h / 2, w / 2], zoom_start=0, crs="Simple", min_zoom=-1, max_zoom=4,
                                            width="100%", height=400)
                             folium.raster_layers.ImageOverlay(image=arr, bounds=[[0, 0], [h, w]], interactive=True,
@@ -667,95 +539,92 @@ elif page == "Gérer":
                     st.write("### Mettre à jour statut")
                     idx = st.selectbox("Sélectionner une annotation", filt.index, format_func=lambda
                         i: f"{filt.loc[i, 'timestamp']} – {filt.loc[i, 'comment'][:20]}")
+                    # Identifiant unique si présent ; les anciennes annotations n'ont que leur horodatage
+                    selected_id = filt.loc[idx, "id"] if "id" in filt.columns else None
+                    if isinstance(selected_id, str) and selected_id:
+                        def is_selected(ann):
+                            return ann.get("id") == selected_id
+                    else:
+                        def is_selected(ann):
+                            return not ann.get("id") and ann["timestamp"] == filt.loc[idx, "timestamp"]
                     image_idx = next(i for i, img in enumerate(project["images"]) if
-                                     any(ann["timestamp"] == filt.loc[idx, "timestamp"] for ann in img["annotations"]))
-                    new_stat = st.selectbox("Nouveau statut", ["À faire", "En cours", "Résolu"], key="upd_status")
+                                     any(is_selected(ann) for ann in img["annotations"]))
+                    new_stat = st.selectbox("Nouveau statut", STATUSES, key="upd_status")
                     if st.button("Mettre à jour"):
+                        project = copy.deepcopy(project)
+                        stats = current_stats(selected_project)
                         for ann in project["images"][image_idx]["annotations"]:
-                            if ann["timestamp"] == filt.loc[idx, "timestamp"]:
+                            if is_selected(ann):
+                                planning.apply_annotation(stats, ann, -1)
                                 ann["status"] = new_stat
+                                planning.apply_annotation(stats, ann)
                                 break
-                        save_projects_to_s3(st.session_state["projects"])
+                        save_projects_to_s3([project], stats={selected_project: stats})
                         st.rerun()
 
 elif page == "Planning":
     st.header("Planning des tâches")
-    if not st.session_state["projects"]:
+    if not project_names:
         st.warning("Aucun projet existant.")
     else:
-        project_names = [proj["project_name"] for proj in st.session_state["projects"] if "project_name" in proj]
         selected_project = st.selectbox("Sélectionnez un projet", project_names,
-                                        index=project_names.index(st.session_state["selected_project"]))
+                                        index=project_names.index(st.session_state["selected_project"])
+                                        if st.session_state["selected_project"] in project_names else 0)
         st.session_state["selected_project"] = selected_project
-        project_idx = next(
-            i for i, proj in enumerate(st.session_state["projects"]) if proj["project_name"] == selected_project)
-        project = st.session_state["projects"][project_idx]
+        project = get_project(selected_project)
+        stats = current_stats(selected_project)
+        today = datetime.today().date()
+
+        # Tableau de bord : lu dans les agrégats du catalogue, sans parcourir les annotations
+        totals = planning.status_totals(stats)
+        cols = st.columns(len(STATUSES) + 1)
+        for col, status in zip(cols, STATUSES):
+            col.metric(status, totals.get(status, 0))
+        cols[-1].metric("En retard", planning.overdue_count(stats, today))
+        if stats["by_week"]:
+            st.write("### Échéances par semaine")
+            st.bar_chart(planning.stats_frame(stats, "by_week"))
+            col_cat, col_ivt = st.columns(2)
+            col_cat.write("#### Par catégorie")
+            col_cat.dataframe(planning.stats_frame(stats, "by_category"))
+            col_ivt.write("#### Par intervenant")
+            col_ivt.dataframe(planning.stats_frame(stats, "by_intervenant"))
+
         if not project["images"]:
             st.warning("Aucune image dans ce projet.")
         else:
-            annotations_list = [pd.DataFrame(img["annotations"]) for img in project["images"] if img["annotations"]]
-            if annotations_list:
-                all_annotations = pd.concat(annotations_list, ignore_index=True)
-                if "due_date" in all_annotations.columns:
-                    all_annotations["due_date"] = pd.to_datetime(all_annotations["due_date"], errors='coerce')
+            due_index = get_due_index(selected_project)
+            if any(img["annotations"] for img in project["images"]):
+                if len(due_index):
                     dr = st.date_input("Plage de dates", [], key="cal_range")
                     if len(dr) == 2:
                         start, end = dr
                         start = pd.to_datetime(start)
                         end = pd.to_datetime(end)
-                        filt = all_annotations[
-                            all_annotations["due_date"].notna() & (all_annotations["due_date"] >= start) & (
-                                        all_annotations["due_date"] <= end)]
+                        filt = due_index.frame(start, end)
                         if not filt.empty:
                             st.dataframe(
                                 filt[["timestamp", "category", "intervenant", "comment", "status", "due_date"]])
-                            # Génération du PDF avec l'image annotée
+                            # Diagramme de Gantt : de la création de l'annotation à son échéance
+                            gantt = filt.assign(start=pd.to_datetime(filt["timestamp"], errors="coerce"),
+                                                label=filt["comment"].str.slice(0, 40))
+                            st.altair_chart(
+                                alt.Chart(gantt).mark_bar().encode(
+                                    x=alt.X("start:T", title="Création"),
+                                    x2="due_date:T",
+                                    y=alt.Y("label:N", sort=None, title="Tâche"),
+                                    color=alt.Color("status:N", title="Statut"),
+                                    tooltip=["comment", "category", "intervenant", "status", "due_date"]),
+                                use_container_width=True)
+                            # Génération du PDF avec l'image annotée (premier plan du projet)
                             if st.button("Générer PDF"):
-                                # 1) Récupérez d’abord l’octet de l’image depuis S3
-                                image_data = project["images"][0]  # ou l’index que vous voulez
-                                uploaded_bytes = download_from_s3(image_data["image_key"])
-                                # 2) Chargez vraiment l’image en PIL
-                                pil_img = load_image_from_bytes(uploaded_bytes, image_data["image_name"])
-                                if pil_img is None:
-                                    st.error("Impossible de charger le plan pour PDF")
+                                try:
+                                    pdf_buffer = build_planning_report(project, start, end, storage.download_file,
+                                                                       raster_store=get_raster_store(),
+                                                                       due_index=due_index)
+                                except Exception as e:
+                                    st.error(f"Impossible de charger le plan pour PDF : {e}")
                                 else:
-                                    # 3) Convertissez-la en RGB et dessinez vos annotations
-                                    img = pil_img.convert("RGB")
-                                    draw = ImageDraw.Draw(img)
-                                    w, h = img.size
-                                    for _, ann in filt.iterrows():
-                                        x_pix = ann["x"] * w
-                                        # Inverser la coordonnée Y pour correspondre au système ReportLab
-                                        y_pix = (1 - ann["y"]) * h
-                                        if ann["type"] == "point":
-                                            r = 10
-                                            draw.ellipse(
-                                                [x_pix - r, y_pix - r, x_pix + r, y_pix + r],
-                                                fill="red",
-                                                outline="black"
-                                            )
-                                        else:
-                                            w_px = ann["width"] * w
-                                            h_px = ann["height"] * h
-                                            # Ajuster le rectangle avec l'inversion Y correcte
-                                            y_top = y_pix  # Coin supérieur (inversé)
-                                            y_bottom = y_pix - h_px  # Coin inférieur
-                                            draw.rectangle([x_pix, y_bottom, x_pix + w_px, y_top],
-                                                           outline="blue", width=2)
-
-                                    # 4) Puis passez img à votre générateur ReportLab
-                                    # Construisez d’abord annotation_desc avant d’appeler le PDF :
-                                    annotation_desc = []
-                                    for _, ann in filt.iterrows():
-                                        pos = f"x={ann['x']:.2f}, y={ann['y']:.2f}"
-                                        if ann['type'] == "rectangle":
-                                            pos += f", largeur={ann['width']:.2f}, hauteur={ann['height']:.2f}"
-                                        annotation_desc.append(
-                                            f"{ann['type'].capitalize()} à {pos} – {ann['comment']} (Statut : {ann['status']})"
-                                        )
-
-                                    # Puis :
-                                    pdf_buffer = generate_planning_pdf(img, all_annotations, filt, start, end)
                                     st.download_button("Télécharger le PDF", data=pdf_buffer,
                                                        file_name="planning.pdf", mime="application/pdf")
                         else:
@@ -763,4 +632,83 @@ elif page == "Planning":
                 else:
                     st.info("Pas d’échéance disponible.")
             else:
-                st.info("Aucune annotation enregistrée dans ce projet.")
\ No newline at end of file
+                st.info("Aucune annotation enregistrée dans ce projet.")
+
+        # Tâches en retard sur tous les projets : compteurs lus dans le catalogue, détail chargé
+        # uniquement pour le projet demandé
+        st.write("### Tâches en retard (tous projets)")
+        late_counts = {e["project_name"]: planning.overdue_count(project_catalog.entry_stats(e), today)
+                       for e in st.session_state["catalog"]}
+        late_counts = {name: n for name, n in late_counts.items() if n}
+        if not late_counts:
+            st.success("Aucune tâche en retard.")
+        else:
+            st.dataframe(pd.DataFrame({"Projet": list(late_counts), "En retard": list(late_counts.values())})
+                         .sort_values("En retard", ascending=False), hide_index=True)
+            late_names = list(late_counts)
+            late_project = st.selectbox("Détail des tâches en retard", late_names,
+                                        index=late_names.index(selected_project)
+                                        if selected_project in late_names else None,
+                                        placeholder="Choisir un projet", key="overdue_project")
+            if late_project:
+                overdue = get_due_index(late_project).overdue(today)
+                st.dataframe(overdue[["image_name", "comment", "category", "intervenant", "status", "due_date"]])
+
+elif page == "Import / Export":
+    st.header("Import / export des annotations")
+
+    st.subheader("Exporter")
+    scope = st.selectbox("Projet", ["Tous les projets"] + project_names, key="export_scope")
+    fmt_label = st.radio("Format", list(EXPORT_FORMATS), horizontal=True, key="export_format")
+    if st.button("Préparer l'export"):
+        fmt = EXPORT_FORMATS[fmt_label]
+        # Les blocs sont écrits sur disque puis relus une seule fois : en mémoire, au plus
+        # une copie de l'export (celle que st.download_button sert au navigateur)
+        with tempfile.TemporaryFile() as export_file:
+            try:
+                # Les projets sont chargés un par un pendant l'export
+                entries = st.session_state["catalog"] if scope == "Tous les projets" else [
+                    project_catalog.find_entry(st.session_state["catalog"], scope)]
+                n_rows = export_annotations(project_catalog.iter_projects(entries), fmt, export_file)
+            except Exception as e:
+                st.error(f"Erreur lors de l'export : {e}")
+            else:
+                export_file.seek(0)
+                st.success(f"{n_rows} annotation(s) exportée(s).")
+                mime = {"csv": "text/csv", "parquet": "application/octet-stream",
+                        "geojson": "application/geo+json"}[fmt]
+                st.download_button("Télécharger l'export", data=export_file.read(),
+                                   file_name=f"annotations.{fmt}", mime=mime)
+
+    st.subheader("Importer")
+    st.caption("Colonnes attendues : " + ", ".join(EXPORT_COLUMNS)
+               + ". Coordonnées normalisées entre 0 et 1, échéance au format AAAA-MM-JJ.")
+    if st.session_state.get("import_message"):
+        st.success(st.session_state.pop("import_message"))
+    # Changer la clé vide le champ de fichier après un import (sinon le bouton réimporterait le même lot)
+    up = st.file_uploader("Fichier CSV / Parquet / GeoJSON", type=["csv", "parquet", "geojson", "json"],
+                          key=f"import_file_{st.session_state.get('import_round', 0)}")
+    if up:
+        try:
+            raw = read_annotations_file(up.read(), up.name)
+        except Exception as e:
+            st.error(f"Erreur lors de la lecture de {up.name} : {e}")
+        else:
+            catalog_names = set(project_names)
+            targets = [get_project(name) for name in raw["project_name"].dropna().astype(str).str.strip().unique()
+                       if name in catalog_names] if "project_name" in raw.columns else []
+            valid, errors = validate_annotations_df(raw, project_catalog.known_images(st.session_state["catalog"]),
+                                                    existing_projects=targets)
+            st.write(f"{len(valid)} annotation(s) valide(s) sur {len(raw)} ligne(s).")
+            if not errors.empty:
+                st.warning(f"{errors['ligne'].nunique()} ligne(s) rejetée(s).")
+                st.dataframe(errors)
+            if not valid.empty and st.button(f"Importer {len(valid)} annotation(s)"):
+                touched = [copy.deepcopy(get_project(name)) for name in valid["project_name"].unique()]
+                import_annotations(touched, valid)
+                stats = {name: planning.apply_frame(current_stats(name), group)
+                         for name, group in valid.groupby("project_name")}
+                if save_projects_to_s3(touched, stats=stats):
+                    st.session_state["import_message"] = f"Import terminé : {len(valid)} annotation(s) ajoutée(s)."
+                    st.session_state["import_round"] = st.session_state.get("import_round", 0) + 1
+                    st.rerun()
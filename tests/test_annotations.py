@@ -0,0 +1,88 @@
+import copy
+import io
+
+import pandas as pd
+import pytest
+
+from buildozair.annotations import (export_annotations, import_annotations, make_annotation, read_annotations_file,
+                                    validate_annotations_df)
+
+KNOWN = [("Chantier", "plan.pdf")]
+
+
+def _project():
+    return {"project_name": "Chantier", "images": [
+        {"image_name": "plan.pdf", "annotations": [
+            make_annotation("point", 0.1, 0.2, due_date="2025-05-21"),
+            make_annotation("rectangle", 0.3, 0.3, 0.1, 0.1, status="En cours", due_date="2025-05-28"),
+        ]},
+    ]}
+
+
+def _row(**fields):
+    row = {"project_name": "Chantier", "image_name": "plan.pdf", "x": 0.5, "y": 0.5}
+    row.update(fields)
+    return row
+
+
+def test_valid_row_gets_defaults_and_id():
+    valid, errors = validate_annotations_df(pd.DataFrame([_row(), _row()]), KNOWN)
+    assert errors.empty
+    assert valid["type"].tolist() == ["point", "point"]
+    assert valid["status"].tolist() == ["À faire", "À faire"]
+    assert valid["id"].nunique() == 2
+
+
+@pytest.mark.parametrize("fields, reason", [
+    ({"category": "Plomberie"}, "catégorie invalide"),
+    ({"status": "Fini"}, "statut invalide"),
+    ({"type": "cercle"}, "type invalide"),
+    ({"due_date": "21/05/2025"}, "échéance invalide (AAAA-MM-JJ attendu)"),
+    ({"timestamp": "hier"}, "horodatage invalide (AAAA-MM-JJ HH:MM:SS attendu)"),
+    ({"x": None}, "coordonnées manquantes"),
+    ({"x": 1.2}, "coordonnées hors du plan (0-1)"),
+    ({"type": "rectangle", "x": 0.9, "width": 0.2, "height": 0.1}, "coordonnées hors du plan (0-1)"),
+    ({"image_name": "coupe.png"}, "couple projet / image inconnu"),
+    ({"project_name": ""}, "projet ou image manquant"),
+])
+def test_rejection_reasons(fields, reason):
+    df = pd.DataFrame([_row(), _row(**fields)])
+    valid, errors = validate_annotations_df(df, KNOWN)
+    assert len(valid) == 1
+    assert errors["ligne"].tolist() == [2]
+    assert errors["erreur"].tolist() == [reason]
+
+
+def test_id_repeated_within_file():
+    df = pd.DataFrame([_row(id="abc"), _row(id="abc"), _row(id="def")])
+    valid, errors = validate_annotations_df(df, KNOWN)
+    assert valid["id"].tolist() == ["abc", "def"]
+    assert errors.to_dict("records") == [{"ligne": 2, "erreur": "identifiant en double dans le fichier"}]
+
+
+def test_existing_timestamp_without_id_is_rejected():
+    project = _project()
+    stamp = project["images"][0]["annotations"][0]["timestamp"]
+    valid, errors = validate_annotations_df(pd.DataFrame([_row(timestamp=stamp)]), KNOWN, [project])
+    assert valid.empty
+    assert errors["erreur"].tolist() == ["annotation déjà présente"]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "geojson"])
+def test_reimporting_an_export_is_rejected(fmt):
+    project = _project()
+    buffer = io.BytesIO()
+    assert export_annotations([project], fmt, buffer) == 2
+
+    raw = read_annotations_file(buffer.getvalue(), f"annotations.{fmt}")
+    valid, errors = validate_annotations_df(raw, KNOWN, [project])
+    assert valid.empty
+    assert errors["erreur"].tolist() == ["annotation déjà présente"] * 2
+
+    # Le même export vers un projet vide est accepté tel quel
+    empty = {"project_name": "Chantier", "images": [{"image_name": "plan.pdf", "annotations": []}]}
+    valid, errors = validate_annotations_df(raw, KNOWN, [empty])
+    assert errors.empty
+    imported = copy.deepcopy(empty)
+    import_annotations([imported], valid)
+    assert imported["images"][0]["annotations"] == project["images"][0]["annotations"]
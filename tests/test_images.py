@@ -0,0 +1,65 @@
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from buildozair.images import STALE_TMP_SECONDS, RasterStore
+
+
+def _pattern_image(h=60, w=80):
+    # Chaque pixel encode sa position : (ligne, colonne, 0)
+    rows, cols = np.indices((h, w), dtype=np.uint8)
+    return Image.fromarray(np.dstack([rows, cols, np.zeros_like(rows)]))
+
+
+def _png_bytes(img):
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_region_returns_requested_pixels(tmp_path):
+    store = RasterStore(str(tmp_path))
+    img = _pattern_image()
+    store.put(store.path("plan"), img)
+
+    crop = store.region("plan", (10, 5, 30, 25))
+
+    assert crop.shape == (20, 20, 3)
+    np.testing.assert_array_equal(crop, np.asarray(img)[5:25, 10:30])
+    assert store.region("absent", (0, 0, 1, 1)) is None
+
+
+def test_preview_survives_eviction_of_full_raster(tmp_path):
+    store = RasterStore(str(tmp_path))
+    data = _png_bytes(_pattern_image())
+    key = store.content_key(data)
+
+    preview, full_shape = store.preview(data, "plan.png", max_side=40)
+    assert full_shape == (60, 80)
+    assert max(preview.shape[:2]) == 40
+
+    os.remove(store.path(key))
+    preview, full_shape = store.preview(data, "plan.png", max_side=40)
+    assert full_shape == (60, 80)
+    assert not os.path.exists(store.path(key))
+
+
+def test_prune_evicts_oldest_and_sweeps_stale_tmp(tmp_path):
+    store = RasterStore(str(tmp_path), max_bytes=0)
+    stale = tmp_path / "crash.tmp"
+    stale.write_bytes(b"x")
+    old = time.time() - STALE_TMP_SECONDS - 1
+    os.utime(stale, (old, old))
+    fresh = tmp_path / "writing.tmp"
+    fresh.write_bytes(b"x")
+
+    store.put(store.path("a"), _pattern_image())
+    store.put(store.path("b"), _pattern_image())
+
+    assert not os.path.exists(store.path("a"))
+    assert os.path.exists(store.path("b"))
+    assert not stale.exists()
+    assert fresh.exists()
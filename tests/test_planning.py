@@ -0,0 +1,71 @@
+import copy
+
+import pandas as pd
+
+from buildozair import planning
+from buildozair.annotations import import_annotations, make_annotation, validate_annotations_df
+
+
+def _project():
+    return {"project_name": "Chantier", "images": [
+        {"image_name": "plan.pdf", "annotations": [
+            make_annotation("point", 0.1, 0.2, category="QHSE", intervenant="Client", due_date="2025-05-21"),
+            make_annotation("rectangle", 0.3, 0.3, 0.1, 0.1, status="En cours", due_date="2025-05-28"),
+            make_annotation("point", 0.5, 0.5, status="Résolu", due_date="2025-05-19"),
+            make_annotation("point", 0.6, 0.6),
+        ]},
+        {"image_name": "coupe.png", "annotations": [
+            make_annotation("point", 0.7, 0.7, category="Qualité", intervenant="Architecte", due_date="2025-06-02"),
+        ]},
+    ]}
+
+
+def test_apply_annotation_matches_recompute():
+    project = _project()
+    stats = planning.project_stats(project)
+
+    ann = make_annotation("point", 0.4, 0.4, category="Planning", due_date="2025-05-20")
+    project["images"][0]["annotations"].append(ann)
+    planning.apply_annotation(stats, ann)
+    assert stats == planning.project_stats(project)
+
+    for status in ("En cours", "Résolu", "À faire"):
+        target = project["images"][0]["annotations"][1]
+        planning.apply_annotation(stats, target, -1)
+        target["status"] = status
+        planning.apply_annotation(stats, target)
+        assert stats == planning.project_stats(project)
+
+    removed = project["images"][1]["annotations"].pop()
+    planning.apply_annotation(stats, removed, -1)
+    assert stats == planning.project_stats(project)
+
+
+def test_apply_frame_matches_recompute():
+    project = _project()
+    stats = planning.project_stats(project)
+    batch = pd.DataFrame({
+        "project_name": "Chantier",
+        "image_name": ["plan.pdf", "coupe.png", "plan.pdf", "plan.pdf"],
+        "x": 0.1, "y": 0.1,
+        "category": ["QHSE", "Autre", "Planning", "QHSE"],
+        "status": ["À faire", "Résolu", "En cours", "À faire"],
+        "due_date": ["2025-05-22", "2025-05-22", "", "2025-06-30"],
+    })
+    valid, errors = validate_annotations_df(batch, [("Chantier", "plan.pdf"), ("Chantier", "coupe.png")], [project])
+    assert errors.empty
+
+    imported = copy.deepcopy(project)
+    import_annotations([imported], valid)
+    assert planning.apply_frame(copy.deepcopy(stats), valid) == planning.project_stats(imported)
+    assert planning.apply_frame(planning.project_stats(imported), valid, -1) == stats
+
+
+def test_due_index_range_and_overdue():
+    index = planning.DueDateIndex(_project())
+    assert len(index) == 4
+    assert index.frame("2025-05-20", "2025-05-28")["due_date"].dt.strftime("%Y-%m-%d").tolist() == [
+        "2025-05-21", "2025-05-28"]
+    overdue = index.overdue(pd.Timestamp("2025-05-29").date())
+    assert sorted(overdue["status"]) == ["En cours", "À faire"]
+    assert planning.overdue_count(planning.project_stats(_project()), pd.Timestamp("2025-05-29").date()) == 2